@@ -1,8 +1,14 @@
 import argparse
-import json
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import itertools
 import logging
 import os
+import re
 import shutil
+import struct
 import subprocess
 import sys
 import xml.etree.ElementTree
@@ -12,11 +18,49 @@ TEMPLATE_DIR = os.path.join(TOP_DIR, "template")
 GENERATED_SOURCES_DIR = os.path.join(TOP_DIR, "src-generated")
 PACKAGE_DIR = os.path.join(GENERATED_SOURCES_DIR, "main", "java", "com", "jgalgo")
 TEST_PACKAGE_DIR = os.path.join(GENERATED_SOURCES_DIR, "test", "java", "com", "jgalgo")
+ECT_DIR = os.path.abspath(os.path.join(TOP_DIR, "..", "ect"))
+ECLIPSE_FORMATTER_CONFIG_FILE = os.path.join(ECT_DIR, "eclipse-java-style.xml")
 TYPE_ALL = {"Obj", "Byte", "Short", "Int", "Long", "Float", "Double", "Bool", "Char"}
-
-HASHES_FILENAME = os.path.join(GENERATED_SOURCES_DIR, ".gen", "hashes.json")
+# The (key, value) types of the generated data structures, shared by a data structure and its tests
+KEY_VALUE_TYPES_BASIC = [("Int", "Int"), ("Obj", "Obj")]
+KEY_VALUE_TYPES_BINARY_SEARCH_TREE = KEY_VALUE_TYPES_BASIC + [("Double", "Obj")]
+KEY_VALUE_TYPES_REFERENCEABLE_HEAP = [
+    ("Int", "Int"),
+    ("Int", "Void"),
+    ("Long", "Int"),
+    ("Double", "Int"),
+    ("Double", "Obj"),
+    ("Obj", "Void"),
+    ("Obj", "Obj"),
+]
+
+HASHES_FILENAME = os.path.join(GENERATED_SOURCES_DIR, ".gen", "hashes.bin")
+HASH_ALGORITHM = "sha256"
+HASH_SIZE = hashlib.new(HASH_ALGORITHM).digest_size
+# The hashes file starts with a header identifying its format version and hash algorithm, a file with a different
+# header is discarded and all sources are regenerated. The header is followed by two sections, the input files (the
+# templates, this script and the formatter config) and the outputs. Each section is a count of entries, followed by
+# the entries. An entry is the path length and the path (utf-8, relative to TOP_DIR), followed by the size,
+# modification time and raw digest of an input file, or the raw digests of the template, the generator configuration
+# and the generated content of an output followed by the output file size and modification time.
+HASHES_HEADER = ("gensources-hashes-v2-" + HASH_ALGORITHM + "\n").encode()
+HASHES_COUNT_STRUCT = struct.Struct("<I")
+HASHES_PATH_LEN_STRUCT = struct.Struct("<H")
+HASHES_FILE_STAT_STRUCT = struct.Struct("<QQ")
+
+# Formatted outputs are kept in a cache keyed by the hash of their template and generator configuration, which
+# includes the hash of the formatter config, so switching back to a previous state of the templates restores the
+# outputs instead of generating and formatting them again. The least recently used entries are evicted once the cache
+# has more than GENERATED_CACHE_MAX_FILES entries.
+GENERATED_CACHE_DIR = os.path.join(GENERATED_SOURCES_DIR, ".gen", "cache")
+GENERATED_CACHE_MAX_FILES = 1024
+
+OutputHash = collections.namedtuple(
+    "OutputHash", ["template_hash", "generator_hash", "content_hash", "stat"]
+)
 
 
+@functools.lru_cache(maxsize=None)
 def find_eclipse():
     path = shutil.which("eclipse")
     if path is not None:
@@ -39,16 +83,22 @@ def find_eclipse():
 
 
 def format_source_files(filenames):
+    # The filenames may be produced lazily while the files are generated. Formatting a chunk of files starts as soon as
+    # the chunk is full, overlapping with the generation of the rest of the files
+    filenames = iter(filenames)
+    first_filename = next(filenames, None)
+    if first_filename is None:
+        return False
+    filenames = itertools.chain([first_filename], filenames)
     logging.info("Formatting generated files...")
     ECLIPSE_PATH = find_eclipse()
     if ECLIPSE_PATH is None:
         logging.warning("Failed to find eclipse.")
-        return
+        for _ in filenames:
+            pass
+        return False
 
     # The formatter config file is an xml file used by vscode. Eclipse uses a different format. We read the xml and write a new config file for eclipse.
-    ECT_DIR = os.path.abspath(os.path.join(TOP_DIR, "..", "ect"))
-    ECLIPSE_FORMATTER_CONFIG_FILE = os.path.join(ECT_DIR, "eclipse-java-style.xml")
-
     profiles_root = xml.etree.ElementTree.parse(ECLIPSE_FORMATTER_CONFIG_FILE).getroot()
     if profiles_root.tag != "profiles":
         raise Exception("unexpected root tag: " + profiles_root.tag)
@@ -64,12 +114,10 @@ def format_source_files(filenames):
             for id, val in settings:
                 f.write(id + "=" + val + "\n")
 
-        # eclipse has a command line limit
-        def chunker(seq, size):
-            return (seq[pos : pos + size] for pos in range(0, len(seq), size))
-
-        for filenames_chunk in chunker(filenames, 50):
-            subprocess.check_call(
+        def format_chunk(filenames_chunk):
+            # The formatter runs concurrently with the generation, capture its output rather than interleaving it with
+            # the generation logs
+            res = subprocess.run(
                 [
                     ECLIPSE_PATH,
                     "-data",
@@ -83,230 +131,405 @@ def format_source_files(filenames):
                     *filenames_chunk,
                 ],
                 cwd=TOP_DIR,
-                shell=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
             )
+            if res.returncode != 0:
+                logging.error("Eclipse formatter failed:\n%s", res.stdout)
+                res.check_returncode()
+            logging.debug("%s", res.stdout)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            futures = []
+            filenames_chunk = []
+            for filename in filenames:
+                filenames_chunk.append(filename)
+                # eclipse has a command line limit
+                if len(filenames_chunk) == 50:
+                    futures.append(executor.submit(format_chunk, filenames_chunk))
+                    filenames_chunk = []
+            if filenames_chunk:
+                futures.append(executor.submit(format_chunk, filenames_chunk))
+            for future in futures:
+                future.result()
     finally:
         if os.path.exists(formatter_config_file):
             os.remove(formatter_config_file)
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def read_template(template_filename):
+    # Each template is expanded for multiple types, read it only once
+    with open(template_filename) as template_file:
+        return template_file.read()
+
+
+def validate_template(template_filename, function_names):
+    # Check the structure of the template once, before it is expanded for each of its types, so a broken template
+    # fails fast with the location of the error
+    text = read_template(template_filename)
+
+    def error(line_idx, msg):
+        raise ValueError("%s:%d: %s" % (template_filename, line_idx + 1, msg))
+
+    open_ifs = []
+    for line_idx, line in enumerate(text.splitlines()):
+        if line.startswith(("#if ", "#elif ")):
+            if line.startswith("#elif ") and not open_ifs:
+                error(line_idx, "#elif without #if")
+            try:
+                compile_condition(line.split(" ", 1)[1])
+            except SyntaxError as e:
+                error(line_idx, "invalid condition: " + str(e))
+            if line.startswith("#if "):
+                open_ifs.append(line_idx)
+        elif line.startswith("#else") and not open_ifs:
+            error(line_idx, "#else without #if")
+        elif line.startswith("#endif"):
+            if not open_ifs:
+                error(line_idx, "#endif without #if")
+            open_ifs.pop()
+    if open_ifs:
+        error(open_ifs[-1], "#if without #endif")
+
+    if function_names:
+        pattern = compile_substitution_pattern(function_names)
+        for match in pattern.finditer(text):
+            try:
+                find_func_args(text, match.end())
+            except (ValueError, IndexError):
+                error(
+                    text.count("\n", 0, match.start()),
+                    "invalid call of " + match.group(),
+                )
 
 
-def generate_sourcefile(input_filename, output_filename, constants, functions):
-    logging.info("Generating %s", os.path.relpath(output_filename, TOP_DIR))
+@functools.lru_cache(maxsize=None)
+def compile_condition(condition):
+    # The same conditions are evaluated for each of the template types, compile them once
+    return compile(condition, "<condition>", "eval")
 
-    def apply_function(text, func_name, func):
-        begin = 0
-        while True:
-            begin = text.find(func_name, begin)
-            if begin == -1:
-                return text
-            words, end = find_func_args(text, begin + len(func_name))
-            text = text[:begin] + func(*words) + text[end:]
-
-    text = open(input_filename).read()
-
-    # Solve all '#if' and '#ifdef' directives
-    root_block = {"type": "container", "blocks": []}
-    stack = [root_block]
-    for line in text.splitlines():
-        if line.startswith("#if "):
-            block = {
-                "type": "if",
-                "condition": line[len("#if ") :],
-                "blocks": [],
-            }
-            stack[-1]["blocks"].append(block)
-            stack.append(block)
-
-        elif line.startswith("#elif "):
-            stack.pop()
-            block = {"type": "elif", "condition": line[len("#elif ") :], "blocks": []}
-            stack[-1]["blocks"].append(block)
-            stack.append(block)
-
-        elif line.startswith("#else"):
-            stack.pop()
-            block = {"type": "else", "blocks": []}
-            stack[-1]["blocks"].append(block)
-            stack.append(block)
 
-        elif line.startswith("#endif"):
-            stack.pop()
-            block = {"type": "endif", "blocks": []}
-            stack[-1]["blocks"].append(block)
+TEMPLATE_DIRECTIVE_RE = re.compile(r"^(#if |#elif |#else|#endif)(.*)(?:\n|\Z)", re.M)
+
+
+@functools.lru_cache(maxsize=None)
+def parse_template(template_filename):
+    # Parse the template once into a flat list of text blocks and '#if' directives, the list is evaluated for each of
+    # the template types. The text between two directives is kept as a single block of complete lines.
+    text = read_template(template_filename)
 
+    # A template without directives is a single text block, skip scanning it for directives
+    if "#if " not in text:
+        return [("text", text)] if text else []
+
+    blocks = []
+    pos = 0
+    for directive in TEMPLATE_DIRECTIVE_RE.finditer(text):
+        if directive.start() > pos:
+            blocks.append(("text", text[pos : directive.start()]))
+        pos = directive.end()
+        directive_type, condition = directive.groups()
+        if directive_type == "#if ":
+            blocks.append(("if", compile_condition(condition)))
+        elif directive_type == "#elif ":
+            blocks.append(("elif", compile_condition(condition)))
+        elif directive_type == "#else":
+            blocks.append(("else", None))
         else:
-            stack[-1]["blocks"].append(line)
-    text = []
+            blocks.append(("endif", None))
+    if pos < len(text):
+        blocks.append(("text", text[pos:]))
+    return blocks
 
-    def eval_condition(condition):
-        return eval(condition, {}, constants)
-
-    def append_lines(top_block):
-        block_num = len(top_block["blocks"])
-        block_idx = 0
-        while block_idx < block_num:
-            block = top_block["blocks"][block_idx]
-            if isinstance(block, str):
-                text.append(block)
-                block_idx += 1
-                continue
-            assert block["type"] == "if", "unexpected block type: " + block["type"]
-            while True:
-                if block["type"] == "else" or eval_condition(block["condition"]):
-                    append_lines(block)
-                    block_idx += 1
-                    block = top_block["blocks"][block_idx]
-                    while block["type"] != "endif":
-                        block_idx += 1
-                        block = top_block["blocks"][block_idx]
-                    block_idx += 1
-                    break
-
-                block_idx += 1
-                block = top_block["blocks"][block_idx]
-                if block["type"] == "endif":
-                    block_idx += 1
-                    break
-                assert (
-                    block["type"] == "if"
-                    or block["type"] == "elif"
-                    or block["type"] == "else"
-                )
 
-    append_lines(root_block)
-    text = "\n".join(text)
+def generate_sourcefile(
+    input_filename, output_filename, constants, functions, last_content_hash=None
+):
+    logging.info("Generating %s", os.path.relpath(output_filename, TOP_DIR))
+
+    # Solve all '#if' directives in a single pass. For each open '#if' the stack holds whether its parent is emitted
+    # and whether one of its branches was already taken. Conditions are evaluated only when their branch may be taken.
+    text = []
+    emitting = True
+    stack = []
+    for block_type, value in parse_template(input_filename):
+        if block_type == "text":
+            if emitting:
+                text.append(value)
+        elif block_type == "if":
+            stack.append([emitting, False])
+            emitting = emitting and eval(value, {}, constants)
+            stack[-1][1] = emitting
+        elif block_type == "elif":
+            parent_emitting, taken = stack[-1]
+            emitting = parent_emitting and not taken and eval(value, {}, constants)
+            stack[-1][1] = taken or emitting
+        elif block_type == "else":
+            parent_emitting, taken = stack[-1]
+            emitting = parent_emitting and not taken
+            stack[-1][1] = True
+        else:
+            emitting = stack.pop()[0]
 
-    # Add a newline at the end if there isn't one
+    text = "".join(text)
+
+    # The blocks are complete lines. Drop the last line terminator, as if the lines were joined, and add a newline at
+    # the end if there isn't one
+    if text.endswith("\n"):
+        text = text[:-1]
     if len(text) == 0 or text[-1] != "\n":
         text += "\n"
 
-    # Replace all constants one by one, in reverse sorted order to (hopefully) avoid one constant being a prefix of another
-    sorted_constants = sorted(constants.items(), key=lambda kv: kv[0], reverse=True)
-    for constant, value in sorted_constants:
-        text = text.replace(constant, value)
+    text = substitute(text, constants, functions)
 
-    # Replace all functions calls one by one, in reverse sorted order to (hopefully) avoid one constant being a prefix of another
-    sorted_functions = sorted(functions.items(), key=lambda kv: kv[0], reverse=True)
-    for func_name, func in sorted_functions:
-        text = apply_function(text, func_name, func)
+    # Don't touch the output file if its content is the same, to avoid unnecessary recompilation of dependents. The
+    # output file may have been formatted after it was generated, so the hash of the last generated content is
+    # compared in addition to the file content. A file equal to the generated content was not formatted, as after an
+    # interrupted run or a formatter failure, so it is not rewritten but it still needs formatting
+    content_hash = hashlib.new(HASH_ALGORITHM, text.encode()).digest()
+    if content_hash == last_content_hash and os.path.exists(output_filename):
+        return False, content_hash
+    try:
+        with open(output_filename) as output_file:
+            if output_file.read() == text:
+                return True, content_hash
+    except FileNotFoundError:
+        pass
 
+    # Write to a temporary file and replace, so an interrupted run doesn't leave a partial output file
     os.makedirs(os.path.dirname(os.path.realpath(output_filename)), exist_ok=True)
-    with open(output_filename, "w") as output_file:
+    tmp_filename = output_filename + ".tmp"
+    with open(tmp_filename, "w") as output_file:
         output_file.write(text)
+    os.replace(tmp_filename, output_filename)
+    return True, content_hash
+
+
+@functools.lru_cache(maxsize=None)
+def compile_substitution_pattern(names):
+    # The names are arranged in a trie and the pattern follows its structure, so at each position of the text the
+    # common prefixes of the names are matched once rather than trying every name. The optional suffixes are greedy, so
+    # when one name is a prefix of another the longest one is matched
+    trie = {}
+    for name in names:
+        node = trie
+        for c in name:
+            node = node.setdefault(c, {})
+        node[""] = None
+
+    def trie_to_regex(node):
+        alternatives = [
+            re.escape(c) + trie_to_regex(child)
+            for c, child in sorted(node.items())
+            if c != ""
+        ]
+        if not alternatives:
+            return ""
+        regex = "|".join(alternatives)
+        if len(alternatives) > 1:
+            regex = "(?:" + regex + ")"
+        if "" in node:
+            regex = "(?:" + regex + ")?"
+        return regex
+
+    return re.compile(trie_to_regex(trie))
+
+
+def substitute(text, constants, functions):
+    # Replace all constants and functions calls in a single scan of the text
+    if not constants and not functions:
+        return text
+    # Many types share the same constants and functions names, so the pattern is compiled once per names set
+    pattern = compile_substitution_pattern(frozenset([*constants, *functions]))
+
+    # Fast path for texts without function calls, all matches are constants which are replaced within re.sub
+    if (
+        not functions
+        or compile_substitution_pattern(frozenset(functions)).search(text) is None
+    ):
+        return pattern.sub(lambda match: constants[match.group()], text)
+
+    def substitute0(text):
+        res = []
+        pos = 0
+        while True:
+            match = pattern.search(text, pos)
+            if match is None:
+                res.append(text[pos:])
+                return "".join(res)
+            res.append(text[pos : match.start()])
+            name = match.group(0)
+            if name in functions:
+                words, pos = find_func_args(text, match.end())
+                res.append(functions[name](*map(substitute0, words)))
+            else:
+                res.append(constants[name])
+                pos = match.end()
+
+    return substitute0(text)
+
+
+FUNC_ARGS_TOKEN_RE = re.compile(r"[(),]")
 
 
 def find_func_args(text, begin):
     if text[begin] != "(":
         raise ValueError("not a beginning of a function call")
-    open_parenthesis = 1
-    begin += 1
+    # Scan only the parenthesis and commas, the text between them is copied as a whole. Whitespace is not part of
+    # the arguments.
+    open_parenthesis = 0
     words = []
-    word = ""
-    while True:
-        while text[begin].isspace():
-            begin += 1
-        if text[begin] == "(":
+    word_begin = begin + 1
+    for token in FUNC_ARGS_TOKEN_RE.finditer(text, begin):
+        if token.group() == "(":
             open_parenthesis += 1
-            word += text[begin]
-        elif text[begin] == ")":
+        elif token.group() == ")":
             open_parenthesis -= 1
             if open_parenthesis == 0:
-                words.append(word)
-                return words, begin + 1
-            word += text[begin]
-        elif text[begin] == "," and open_parenthesis == 1:
-            words.append(word)
-            word = ""
-        else:
-            word += text[begin]
-        begin += 1
-
-
+                words.append("".join(text[word_begin : token.start()].split()))
+                return words, token.end()
+        elif open_parenthesis == 1:
+            words.append("".join(text[word_begin : token.start()].split()))
+            word_begin = token.end()
+    raise ValueError("unterminated function call")
+
+
+KEY_CONSTANTS_BY_TYPE = {
+    "Void": {
+        "KEY_TYPE_NAME": "Void",
+        "PRIMITIVE_KEY_TYPE": "Void",
+        "PRIMITIVE_KEY_TYPE_REAL": "Void",
+        "KEY_TYPE_GENERIC_CLASS": "Void",
+        "FASTUTIL_KEY_TYPE": "_NONE_",
+        "FASTUTIL_KEY_PACKAGE": "_NONE_",
+    },
+    "Obj": {
+        "KEY_TYPE_NAME": "Obj",
+        "PRIMITIVE_KEY_TYPE_REAL": "Object",
+        "FASTUTIL_KEY_TYPE": "Object",
+        "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.objects",
+    },
+    "Byte": {
+        "KEY_TYPE_NAME": "Byte",
+        "PRIMITIVE_KEY_TYPE": "byte",
+        "PRIMITIVE_KEY_TYPE_REAL": "byte",
+        "KEY_TYPE_GENERIC_CLASS": "Byte",
+        "FASTUTIL_KEY_TYPE": "Byte",
+        "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.bytes",
+    },
+    "Short": {
+        "KEY_TYPE_NAME": "Short",
+        "PRIMITIVE_KEY_TYPE": "short",
+        "PRIMITIVE_KEY_TYPE_REAL": "short",
+        "KEY_TYPE_GENERIC_CLASS": "Short",
+        "FASTUTIL_KEY_TYPE": "Short",
+        "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.shorts",
+    },
+    "Int": {
+        "KEY_TYPE_NAME": "Int",
+        "PRIMITIVE_KEY_TYPE": "int",
+        "PRIMITIVE_KEY_TYPE_REAL": "int",
+        "KEY_TYPE_GENERIC_CLASS": "Integer",
+        "FASTUTIL_KEY_TYPE": "Int",
+        "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.ints",
+    },
+    "Long": {
+        "KEY_TYPE_NAME": "Long",
+        "PRIMITIVE_KEY_TYPE": "long",
+        "PRIMITIVE_KEY_TYPE_REAL": "long",
+        "KEY_TYPE_GENERIC_CLASS": "Long",
+        "FASTUTIL_KEY_TYPE": "Long",
+        "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.longs",
+    },
+    "Float": {
+        "KEY_TYPE_NAME": "Float",
+        "PRIMITIVE_KEY_TYPE": "float",
+        "PRIMITIVE_KEY_TYPE_REAL": "float",
+        "KEY_TYPE_GENERIC_CLASS": "Float",
+        "FASTUTIL_KEY_TYPE": "Float",
+        "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.floats",
+    },
+    "Double": {
+        "KEY_TYPE_NAME": "Double",
+        "PRIMITIVE_KEY_TYPE": "double",
+        "PRIMITIVE_KEY_TYPE_REAL": "double",
+        "KEY_TYPE_GENERIC_CLASS": "Double",
+        "FASTUTIL_KEY_TYPE": "Double",
+        "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.doubles",
+    },
+    "Bool": {
+        "KEY_TYPE_NAME": "Bool",
+        "PRIMITIVE_KEY_TYPE": "boolean",
+        "PRIMITIVE_KEY_TYPE_REAL": "boolean",
+        "KEY_TYPE_GENERIC_CLASS": "Boolean",
+        "FASTUTIL_KEY_TYPE": "Boolean",
+        "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.booleans",
+    },
+    "Char": {
+        "KEY_TYPE_NAME": "Char",
+        "PRIMITIVE_KEY_TYPE": "char",
+        "PRIMITIVE_KEY_TYPE_REAL": "char",
+        "KEY_TYPE_GENERIC_CLASS": "Character",
+        "FASTUTIL_KEY_TYPE": "Char",
+        "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.chars",
+    },
+}
+
+KEY_FUNCTIONS_BY_TYPE = {
+    "Void": {
+        "KEY_PRIMITIVE_TO_BOXED": "{}".format,
+        "KEY_BOXED_TO_PRIMITIVE": "{}".format,
+    },
+    "Obj": {
+        "KEY_PRIMITIVE_TO_BOXED": "{}".format,
+        "KEY_BOXED_TO_PRIMITIVE": "{}".format,
+    },
+    "Byte": {
+        "KEY_PRIMITIVE_TO_BOXED": "Byte.valueOf({})".format,
+        "KEY_BOXED_TO_PRIMITIVE": "{}.byteValue()".format,
+    },
+    "Short": {
+        "KEY_PRIMITIVE_TO_BOXED": "Short.valueOf({})".format,
+        "KEY_BOXED_TO_PRIMITIVE": "{}.shortValue()".format,
+    },
+    "Int": {
+        "KEY_PRIMITIVE_TO_BOXED": "Integer.valueOf({})".format,
+        "KEY_BOXED_TO_PRIMITIVE": "{}.intValue()".format,
+    },
+    "Long": {
+        "KEY_PRIMITIVE_TO_BOXED": "Long.valueOf({})".format,
+        "KEY_BOXED_TO_PRIMITIVE": "{}.longValue()".format,
+    },
+    "Float": {
+        "KEY_PRIMITIVE_TO_BOXED": "Float.valueOf({})".format,
+        "KEY_BOXED_TO_PRIMITIVE": "{}.floatValue()".format,
+    },
+    "Double": {
+        "KEY_PRIMITIVE_TO_BOXED": "Double.valueOf({})".format,
+        "KEY_BOXED_TO_PRIMITIVE": "{}.doubleValue()".format,
+    },
+    "Bool": {
+        "KEY_PRIMITIVE_TO_BOXED": "Boolean.valueOf({})".format,
+        "KEY_BOXED_TO_PRIMITIVE": "{}.booleanValue()".format,
+    },
+    "Char": {
+        "KEY_PRIMITIVE_TO_BOXED": "Character.valueOf({})".format,
+        "KEY_BOXED_TO_PRIMITIVE": "{}.charValue()".format,
+    },
+}
+
+
+@functools.lru_cache(maxsize=None)
 def get_constants_and_functions_key0(key_type, generic_name):
-    constants = {
-        "Void": {
-            "KEY_TYPE_NAME": "Void",
-            "PRIMITIVE_KEY_TYPE": "Void",
-            "PRIMITIVE_KEY_TYPE_REAL": "Void",
-            "KEY_TYPE_GENERIC_CLASS": "Void",
-            "FASTUTIL_KEY_TYPE": "_NONE_",
-            "FASTUTIL_KEY_PACKAGE": "_NONE_",
-        },
-        "Obj": {
-            "KEY_TYPE_NAME": "Obj",
-            "PRIMITIVE_KEY_TYPE": generic_name,
-            "PRIMITIVE_KEY_TYPE_REAL": "Object",
-            "KEY_TYPE_GENERIC_CLASS": generic_name,
-            "FASTUTIL_KEY_TYPE": "Object",
-            "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.objects",
-        },
-        "Byte": {
-            "KEY_TYPE_NAME": "Byte",
-            "PRIMITIVE_KEY_TYPE": "byte",
-            "PRIMITIVE_KEY_TYPE_REAL": "byte",
-            "KEY_TYPE_GENERIC_CLASS": "Byte",
-            "FASTUTIL_KEY_TYPE": "Byte",
-            "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.bytes",
-        },
-        "Short": {
-            "KEY_TYPE_NAME": "Short",
-            "PRIMITIVE_KEY_TYPE": "short",
-            "PRIMITIVE_KEY_TYPE_REAL": "short",
-            "KEY_TYPE_GENERIC_CLASS": "Short",
-            "FASTUTIL_KEY_TYPE": "Short",
-            "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.shorts",
-        },
-        "Int": {
-            "KEY_TYPE_NAME": "Int",
-            "PRIMITIVE_KEY_TYPE": "int",
-            "PRIMITIVE_KEY_TYPE_REAL": "int",
-            "KEY_TYPE_GENERIC_CLASS": "Integer",
-            "FASTUTIL_KEY_TYPE": "Int",
-            "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.ints",
-        },
-        "Long": {
-            "KEY_TYPE_NAME": "Long",
-            "PRIMITIVE_KEY_TYPE": "long",
-            "PRIMITIVE_KEY_TYPE_REAL": "long",
-            "KEY_TYPE_GENERIC_CLASS": "Long",
-            "FASTUTIL_KEY_TYPE": "Long",
-            "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.longs",
-        },
-        "Float": {
-            "KEY_TYPE_NAME": "Float",
-            "PRIMITIVE_KEY_TYPE": "float",
-            "PRIMITIVE_KEY_TYPE_REAL": "float",
-            "KEY_TYPE_GENERIC_CLASS": "Float",
-            "FASTUTIL_KEY_TYPE": "Float",
-            "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.floats",
-        },
-        "Double": {
-            "KEY_TYPE_NAME": "Double",
-            "PRIMITIVE_KEY_TYPE": "double",
-            "PRIMITIVE_KEY_TYPE_REAL": "double",
-            "KEY_TYPE_GENERIC_CLASS": "Double",
-            "FASTUTIL_KEY_TYPE": "Double",
-            "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.doubles",
-        },
-        "Bool": {
-            "KEY_TYPE_NAME": "Bool",
-            "PRIMITIVE_KEY_TYPE": "boolean",
-            "PRIMITIVE_KEY_TYPE_REAL": "boolean",
-            "KEY_TYPE_GENERIC_CLASS": "Boolean",
-            "FASTUTIL_KEY_TYPE": "Boolean",
-            "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.booleans",
-        },
-        "Char": {
-            "KEY_TYPE_NAME": "Char",
-            "PRIMITIVE_KEY_TYPE": "char",
-            "PRIMITIVE_KEY_TYPE_REAL": "char",
-            "KEY_TYPE_GENERIC_CLASS": "Character",
-            "FASTUTIL_KEY_TYPE": "Char",
-            "FASTUTIL_KEY_PACKAGE": "it.unimi.dsi.fastutil.chars",
-        },
-    }[key_type]
+    # Cached, the returned dicts are shared and must be copied before they are modified
+    constants = dict(KEY_CONSTANTS_BY_TYPE[key_type])
 
     if key_type == "Obj":
+        constants["PRIMITIVE_KEY_TYPE"] = generic_name
+        constants["KEY_TYPE_GENERIC_CLASS"] = generic_name
         constants["KEY_TYPE_GENERIC"] = "<" + generic_name + ">"
         constants["KEY_TYPE_GENERIC_IN_TEMPLATE_LIST"] = ", " + generic_name
         constants["KEY_CAST_TO_GENERIC"] = "(" + generic_name + ")"
@@ -319,97 +542,64 @@ def get_constants_and_functions_key0(key_type, generic_name):
         constants["KEY_SUPPRESS_WARNINGS_UNCHECKED"] = ""
         constants["KEY_COMPARATOR"] = constants["FASTUTIL_KEY_TYPE"] + "Comparator"
 
-    functions = {
-        "Void": {
-            "KEY_PRIMITIVE_TO_BOXED": lambda x: x,
-            "KEY_BOXED_TO_PRIMITIVE": lambda x: x,
-        },
-        "Obj": {
-            "KEY_PRIMITIVE_TO_BOXED": lambda x: x,
-            "KEY_BOXED_TO_PRIMITIVE": lambda x: x,
-        },
-        "Byte": {
-            "KEY_PRIMITIVE_TO_BOXED": lambda x: "Byte.valueOf(" + x + ")",
-            "KEY_BOXED_TO_PRIMITIVE": lambda x: x + ".byteValue()",
-        },
-        "Short": {
-            "KEY_PRIMITIVE_TO_BOXED": lambda x: "Short.valueOf(" + x + ")",
-            "KEY_BOXED_TO_PRIMITIVE": lambda x: x + ".shortValue()",
-        },
-        "Int": {
-            "KEY_PRIMITIVE_TO_BOXED": lambda x: "Integer.valueOf(" + x + ")",
-            "KEY_BOXED_TO_PRIMITIVE": lambda x: x + ".intValue()",
-        },
-        "Long": {
-            "KEY_PRIMITIVE_TO_BOXED": lambda x: "Long.valueOf(" + x + ")",
-            "KEY_BOXED_TO_PRIMITIVE": lambda x: x + ".longValue()",
-        },
-        "Float": {
-            "KEY_PRIMITIVE_TO_BOXED": lambda x: "Float.valueOf(" + x + ")",
-            "KEY_BOXED_TO_PRIMITIVE": lambda x: x + ".floatValue()",
-        },
-        "Double": {
-            "KEY_PRIMITIVE_TO_BOXED": lambda x: "Double.valueOf(" + x + ")",
-            "KEY_BOXED_TO_PRIMITIVE": lambda x: x + ".doubleValue()",
-        },
-        "Bool": {
-            "KEY_PRIMITIVE_TO_BOXED": lambda x: "Boolean.valueOf(" + x + ")",
-            "KEY_BOXED_TO_PRIMITIVE": lambda x: x + ".booleanValue()",
-        },
-        "Char": {
-            "KEY_PRIMITIVE_TO_BOXED": lambda x: "Character.valueOf(" + x + ")",
-            "KEY_BOXED_TO_PRIMITIVE": lambda x: x + ".charValue()",
-        },
-    }[key_type]
+    functions = dict(KEY_FUNCTIONS_BY_TYPE[key_type])
 
     if key_type == "Obj":
-        cmpDefault = lambda a, b: "JGAlgoUtils.cmpDefault(" + a + ", " + b + ")"
-        functions["COMPARE_KEY_DEFAULT"] = lambda a, b: cmpDefault(a, b)
-        functions["COMPARE_KEY_DEFAULT_EQ"] = lambda a, b: cmpDefault(a, b) + " == 0"
-        functions["COMPARE_KEY_DEFAULT_NEQ"] = lambda a, b: cmpDefault(a, b) + " != 0"
-        functions["COMPARE_KEY_DEFAULT_LE"] = lambda a, b: cmpDefault(a, b) + " < 0"
-        functions["COMPARE_KEY_DEFAULT_LEQ"] = lambda a, b: cmpDefault(a, b) + " <= 0"
-        functions["COMPARE_KEY_DEFAULT_GE"] = lambda a, b: cmpDefault(a, b) + " > 0"
-        functions["COMPARE_KEY_DEFAULT_GEQ"] = lambda a, b: cmpDefault(a, b) + " >= 0"
+        cmpDefault = "JGAlgoUtils.cmpDefault({0}, {1})"
+        functions["COMPARE_KEY_DEFAULT"] = cmpDefault.format
+        functions["COMPARE_KEY_DEFAULT_EQ"] = (cmpDefault + " == 0").format
+        functions["COMPARE_KEY_DEFAULT_NEQ"] = (cmpDefault + " != 0").format
+        functions["COMPARE_KEY_DEFAULT_LE"] = (cmpDefault + " < 0").format
+        functions["COMPARE_KEY_DEFAULT_LEQ"] = (cmpDefault + " <= 0").format
+        functions["COMPARE_KEY_DEFAULT_GE"] = (cmpDefault + " > 0").format
+        functions["COMPARE_KEY_DEFAULT_GEQ"] = (cmpDefault + " >= 0").format
     elif key_type == "Bool":
-        functions["COMPARE_KEY_DEFAULT_EQ"] = lambda a, b: a + " == " + b
-        functions["COMPARE_KEY_DEFAULT_NEQ"] = lambda a, b: a + " != " + b
+        functions["COMPARE_KEY_DEFAULT_EQ"] = "{0} == {1}".format
+        functions["COMPARE_KEY_DEFAULT_NEQ"] = "{0} != {1}".format
         # functions["COMPARE_KEY_DEFAULT_LE"] = None
         # functions["COMPARE_KEY_DEFAULT_LEQ"] = None
         # functions["COMPARE_KEY_DEFAULT_GE"] = None
         # functions["COMPARE_KEY_DEFAULT_GEQ"] = None
     else:
         cmp = constants["KEY_TYPE_GENERIC_CLASS"]
-        functions["COMPARE_KEY_DEFAULT"] = (
-            lambda a, b: cmp + ".compare(" + a + ", " + b + ")"
-        )
-        functions["COMPARE_KEY_DEFAULT_EQ"] = lambda a, b: a + " == " + b
-        functions["COMPARE_KEY_DEFAULT_NEQ"] = lambda a, b: a + " != " + b
-        functions["COMPARE_KEY_DEFAULT_LE"] = lambda a, b: a + " < " + b
-        functions["COMPARE_KEY_DEFAULT_LEQ"] = lambda a, b: a + " <= " + b
-        functions["COMPARE_KEY_DEFAULT_GE"] = lambda a, b: a + " > " + b
-        functions["COMPARE_KEY_DEFAULT_GEQ"] = lambda a, b: a + " >= " + b
+        functions["COMPARE_KEY_DEFAULT"] = (cmp + ".compare({0}, {1})").format
+        functions["COMPARE_KEY_DEFAULT_EQ"] = "{0} == {1}".format
+        functions["COMPARE_KEY_DEFAULT_NEQ"] = "{0} != {1}".format
+        functions["COMPARE_KEY_DEFAULT_LE"] = "{0} < {1}".format
+        functions["COMPARE_KEY_DEFAULT_LEQ"] = "{0} <= {1}".format
+        functions["COMPARE_KEY_DEFAULT_GE"] = "{0} > {1}".format
+        functions["COMPARE_KEY_DEFAULT_GEQ"] = "{0} >= {1}".format
 
     return constants, functions
 
 
 def get_constants_and_functions_key(key_type):
-    return get_constants_and_functions_key0(key_type, "K")
+    constants, functions = get_constants_and_functions_key0(key_type, "K")
+    return dict(constants), dict(functions)
 
 
-def get_constants_and_functions_value(value_type):
-    constants, functions = get_constants_and_functions_key0(value_type, "V")
-    constants = {k.replace("KEY_", "VALUE_"): v for k, v in constants.items()}
-    functions = {k.replace("KEY_", "VALUE_"): v for k, v in functions.items()}
+@functools.lru_cache(maxsize=None)
+def get_constants_and_functions_renamed(type, generic_name, key_replacement):
+    # Cached like get_constants_and_functions_key0. "KEY_" is replaced anywhere in the names, not only as a prefix,
+    # for example in PRIMITIVE_KEY_TYPE
+    constants, functions = get_constants_and_functions_key0(type, generic_name)
+    constants = {k.replace("KEY_", key_replacement): v for k, v in constants.items()}
+    functions = {k.replace("KEY_", key_replacement): v for k, v in functions.items()}
     return constants, functions
 
 
+def get_constants_and_functions_value(value_type):
+    constants, functions = get_constants_and_functions_renamed(
+        value_type, "V", "VALUE_"
+    )
+    return dict(constants), dict(functions)
+
+
 def get_constants_and_functions_key_value(key_type, value_type):
     constants, functions = get_constants_and_functions_key(key_type)
     constants_value, functions_value = get_constants_and_functions_value(value_type)
     constants.update(constants_value)
     functions.update(functions_value)
-    functions.update(functions_value)
 
     if key_type == "Obj" and value_type == "Obj":
         constants["KEY_VALUE_GENERIC"] = "<K, V>"
@@ -433,10 +623,8 @@ def get_constants_and_functions_key_value(key_type, value_type):
 
 
 def get_constants_and_functions(type):
-    constants, functions = get_constants_and_functions_key0(type, "T")
-    constants = {k.replace("KEY_", ""): v for k, v in constants.items()}
-    functions = {k.replace("KEY_", ""): v for k, v in functions.items()}
-    return constants, functions
+    constants, functions = get_constants_and_functions_renamed(type, "T", "")
+    return dict(constants), dict(functions)
 
 
 TEMPLATES = []
@@ -454,51 +642,83 @@ def register_template(template, types, config_func, file_name_func, flavor=None)
     )
 
 
-def generate_template_sources(template_entry):
-    generated_files = []
-    for types in template_entry["types"]:
-        if template_entry["flavor"] is None:
-            if type(types) is tuple:
-                assert len(types) == 2
-                constants, functions = get_constants_and_functions_key_value(*types)
-            else:
-                constants, functions = get_constants_and_functions(types)
-        elif template_entry["flavor"] == "key":
-            constants, functions = get_constants_and_functions_key(types)
-        elif template_entry["flavor"] == "key_value":
-            constants, functions = get_constants_and_functions_key_value(*types)
-        elif template_entry["flavor"] == "value":
-            constants, functions = get_constants_and_functions_value(types)
-        elif template_entry["flavor"] == "element":
-            constants, functions = get_constants_and_functions(types)
-        else:
-            raise Exception("Unknown flavor: " + template_entry["flavor"])
-
+def get_template_source_config(template_entry, types):
+    if template_entry["flavor"] is None:
         if type(types) is tuple:
             assert len(types) == 2
-            types = list(types)
+            constants, functions = get_constants_and_functions_key_value(*types)
         else:
-            types = [types]
-        template_entry["config_func"](*types, constants, functions)
-
-        filename = template_entry["file_name_func"](*types)
-        try:
-            generate_sourcefile(
-                os.path.join(TEMPLATE_DIR, template_entry["template"]),
-                filename,
-                constants,
-                functions,
-            )
-        except Exception as e:
-            raise Exception("Failed to generate " + filename) from e
-        generated_files.append(filename)
-    return generated_files
+            constants, functions = get_constants_and_functions(types)
+    elif template_entry["flavor"] == "key":
+        constants, functions = get_constants_and_functions_key(types)
+    elif template_entry["flavor"] == "key_value":
+        constants, functions = get_constants_and_functions_key_value(*types)
+    elif template_entry["flavor"] == "value":
+        constants, functions = get_constants_and_functions_value(types)
+    elif template_entry["flavor"] == "element":
+        constants, functions = get_constants_and_functions(types)
+    else:
+        raise Exception("Unknown flavor: " + template_entry["flavor"])
+
+    if type(types) is tuple:
+        assert len(types) == 2
+        types = list(types)
+    else:
+        types = [types]
+    template_entry["config_func"](*types, constants, functions)
+
+    filename = template_entry["file_name_func"](*types)
+    return constants, functions, filename
+
+
+def generate_template_source(template_entry, types, last_content_hash=None):
+    constants, functions, filename = get_template_source_config(template_entry, types)
+    try:
+        needs_format, content_hash = generate_sourcefile(
+            os.path.join(TEMPLATE_DIR, template_entry["template"]),
+            filename,
+            constants,
+            functions,
+            last_content_hash,
+        )
+    except Exception as e:
+        raise Exception("Failed to generate " + filename) from e
+    return filename, needs_format, content_hash
+
+
+def generate_template_source_job(job):
+    # The template entries hold lambdas which can not be pickled, so the worker processes receive the index of the
+    # template within TEMPLATES, which is populated when the module is imported
+    template_idx, types, last_content_hash = job
+    return generate_template_source(TEMPLATES[template_idx], types, last_content_hash)
 
 
 def key_value_prefix(key_type, value_type):
     return key_type + value_type if value_type != "Void" else key_type
 
 
+def ds_source_filename(package_dir, class_name):
+    # File name function of the key-value data structures, generated into the 'internal.ds' package
+    return lambda key_type, value_type: os.path.join(
+        package_dir,
+        "internal",
+        "ds",
+        key_value_prefix(key_type, value_type) + class_name + ".java",
+    )
+
+
+def set_test_key_value_generic(key_type, value_type, constants):
+    # The tests of the key-value data structures use String for the Obj types
+    if key_type == "Obj" and value_type == "Obj":
+        constants["KEY_VALUE_GENERIC"] = "<String, String>"
+    elif key_type == "Obj":
+        constants["KEY_VALUE_GENERIC"] = "<String>"
+    elif value_type == "Obj":
+        constants["KEY_VALUE_GENERIC"] = "<String>"
+    else:
+        constants["KEY_VALUE_GENERIC"] = ""
+
+
 def generate_weights(type, constants, functions):
     constants["IWEIGHTS"] = "IWeights" + type
     constants["WEIGHTS"] = "Weights" + type
@@ -548,22 +768,9 @@ def generate_referenceable_heap(key_type, value_type, constants, functions):
 
 register_template(
     "ReferenceableHeap",
-    [
-        ("Int", "Int"),
-        ("Int", "Void"),
-        ("Long", "Int"),
-        ("Double", "Int"),
-        ("Double", "Obj"),
-        ("Obj", "Void"),
-        ("Obj", "Obj"),
-    ],
+    KEY_VALUE_TYPES_REFERENCEABLE_HEAP,
     generate_referenceable_heap,
-    lambda key_type, value_type: os.path.join(
-        PACKAGE_DIR,
-        "internal",
-        "ds",
-        key_value_prefix(key_type, value_type) + "ReferenceableHeap.java",
-    ),
+    ds_source_filename(PACKAGE_DIR, "ReferenceableHeap"),
 )
 
 
@@ -576,14 +783,7 @@ def generate_referenceable_heap_test_utils(key_type, value_type, constants, func
     if value_type == "Obj":
         constants["PRIMITIVE_VALUE_TYPE"] = "String"
 
-    if key_type == "Obj" and value_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String, String>"
-    elif key_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String>"
-    elif value_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String>"
-    else:
-        constants["KEY_VALUE_GENERIC"] = ""
+    set_test_key_value_generic(key_type, value_type, constants)
 
     prefix = key_value_prefix(key_type, value_type)
     constants["REFERENCEABLE_HEAP_TEST_UTILS"] = prefix + "ReferenceableHeapTestUtils"
@@ -593,22 +793,9 @@ def generate_referenceable_heap_test_utils(key_type, value_type, constants, func
 
 register_template(
     "ReferenceableHeapTestUtils",
-    [
-        ("Int", "Int"),
-        ("Int", "Void"),
-        ("Long", "Int"),
-        ("Double", "Int"),
-        ("Double", "Obj"),
-        ("Obj", "Void"),
-        ("Obj", "Obj"),
-    ],
+    KEY_VALUE_TYPES_REFERENCEABLE_HEAP,
     generate_referenceable_heap_test_utils,
-    lambda key_type, value_type: os.path.join(
-        TEST_PACKAGE_DIR,
-        "internal",
-        "ds",
-        key_value_prefix(key_type, value_type) + "ReferenceableHeapTestUtils.java",
-    ),
+    ds_source_filename(TEST_PACKAGE_DIR, "ReferenceableHeapTestUtils"),
 )
 
 
@@ -621,22 +808,9 @@ def generate_pairing_heap(key_type, value_type, constants, functions):
 
 register_template(
     "PairingHeap",
-    [
-        ("Int", "Int"),
-        ("Int", "Void"),
-        ("Long", "Int"),
-        ("Double", "Int"),
-        ("Double", "Obj"),
-        ("Obj", "Void"),
-        ("Obj", "Obj"),
-    ],
+    KEY_VALUE_TYPES_REFERENCEABLE_HEAP,
     generate_pairing_heap,
-    lambda key_type, value_type: os.path.join(
-        PACKAGE_DIR,
-        "internal",
-        "ds",
-        key_value_prefix(key_type, value_type) + "PairingHeap.java",
-    ),
+    ds_source_filename(PACKAGE_DIR, "PairingHeap"),
 )
 
 
@@ -650,34 +824,14 @@ def generate_pairing_heap_test(key_type, value_type, constants, functions):
     if key_type == "Obj":
         constants["PRIMITIVE_KEY_TYPE"] = "String"
         constants["KEY_TYPE_GENERIC"] = "<String>"
-    if key_type == "Obj" and value_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String, String>"
-    elif key_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String>"
-    elif value_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String>"
-    else:
-        constants["KEY_VALUE_GENERIC"] = ""
+    set_test_key_value_generic(key_type, value_type, constants)
 
 
 register_template(
     "PairingHeapTest",
-    [
-        ("Int", "Int"),
-        ("Int", "Void"),
-        ("Long", "Int"),
-        ("Double", "Int"),
-        ("Double", "Obj"),
-        ("Obj", "Void"),
-        ("Obj", "Obj"),
-    ],
+    KEY_VALUE_TYPES_REFERENCEABLE_HEAP,
     generate_pairing_heap_test,
-    lambda key_type, value_type: os.path.join(
-        TEST_PACKAGE_DIR,
-        "internal",
-        "ds",
-        key_value_prefix(key_type, value_type) + "PairingHeapTest.java",
-    ),
+    ds_source_filename(TEST_PACKAGE_DIR, "PairingHeapTest"),
 )
 
 
@@ -690,14 +844,9 @@ def generate_binomial_heap(key_type, value_type, constants, functions):
 
 register_template(
     "BinomialHeap",
-    [("Int", "Int"), ("Obj", "Obj")],
+    KEY_VALUE_TYPES_BASIC,
     generate_binomial_heap,
-    lambda key_type, value_type: os.path.join(
-        PACKAGE_DIR,
-        "internal",
-        "ds",
-        key_value_prefix(key_type, value_type) + "BinomialHeap.java",
-    ),
+    ds_source_filename(PACKAGE_DIR, "BinomialHeap"),
 )
 
 
@@ -710,26 +859,14 @@ def generate_binomial_heap_test(key_type, value_type, constants, functions):
     constants["PAIRING_HEAP"] = prefix + "PairingHeap"
     if key_type == "Obj":
         constants["KEY_TYPE_GENERIC"] = "<String>"
-    if key_type == "Obj" and value_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String, String>"
-    elif key_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String>"
-    elif value_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String>"
-    else:
-        constants["KEY_VALUE_GENERIC"] = ""
+    set_test_key_value_generic(key_type, value_type, constants)
 
 
 register_template(
     "BinomialHeapTest",
-    [("Int", "Int"), ("Obj", "Obj")],
+    KEY_VALUE_TYPES_BASIC,
     generate_binomial_heap_test,
-    lambda key_type, value_type: os.path.join(
-        TEST_PACKAGE_DIR,
-        "internal",
-        "ds",
-        key_value_prefix(key_type, value_type) + "BinomialHeapTest.java",
-    ),
+    ds_source_filename(TEST_PACKAGE_DIR, "BinomialHeapTest"),
 )
 
 
@@ -742,14 +879,9 @@ def generate_fibonacci_heap(key_type, value_type, constants, functions):
 
 register_template(
     "FibonacciHeap",
-    [("Int", "Int"), ("Obj", "Obj")],
+    KEY_VALUE_TYPES_BASIC,
     generate_fibonacci_heap,
-    lambda key_type, value_type: os.path.join(
-        PACKAGE_DIR,
-        "internal",
-        "ds",
-        key_value_prefix(key_type, value_type) + "FibonacciHeap.java",
-    ),
+    ds_source_filename(PACKAGE_DIR, "FibonacciHeap"),
 )
 
 
@@ -762,26 +894,14 @@ def generate_fibonacci_heap_test(key_type, value_type, constants, functions):
     constants["PAIRING_HEAP"] = prefix + "PairingHeap"
     if key_type == "Obj":
         constants["KEY_TYPE_GENERIC"] = "<String>"
-    if key_type == "Obj" and value_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String, String>"
-    elif key_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String>"
-    elif value_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String>"
-    else:
-        constants["KEY_VALUE_GENERIC"] = ""
+    set_test_key_value_generic(key_type, value_type, constants)
 
 
 register_template(
     "FibonacciHeapTest",
-    [("Int", "Int"), ("Obj", "Obj")],
+    KEY_VALUE_TYPES_BASIC,
     generate_fibonacci_heap_test,
-    lambda key_type, value_type: os.path.join(
-        TEST_PACKAGE_DIR,
-        "internal",
-        "ds",
-        key_value_prefix(key_type, value_type) + "FibonacciHeapTest.java",
-    ),
+    ds_source_filename(TEST_PACKAGE_DIR, "FibonacciHeapTest"),
 )
 
 
@@ -795,14 +915,9 @@ def generate_binary_search_tree(key_type, value_type, constants, functions):
 
 register_template(
     "BinarySearchTree",
-    [("Int", "Int"), ("Obj", "Obj"), ("Double", "Obj")],
+    KEY_VALUE_TYPES_BINARY_SEARCH_TREE,
     generate_binary_search_tree,
-    lambda key_type, value_type: os.path.join(
-        PACKAGE_DIR,
-        "internal",
-        "ds",
-        key_value_prefix(key_type, value_type) + "BinarySearchTree.java",
-    ),
+    ds_source_filename(PACKAGE_DIR, "BinarySearchTree"),
 )
 
 
@@ -815,14 +930,7 @@ def generate_binary_search_tree_test_utils(key_type, value_type, constants, func
     if value_type == "Obj":
         constants["PRIMITIVE_VALUE_TYPE"] = "String"
 
-    if key_type == "Obj" and value_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String, String>"
-    elif key_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String>"
-    elif value_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String>"
-    else:
-        constants["KEY_VALUE_GENERIC"] = ""
+    set_test_key_value_generic(key_type, value_type, constants)
 
     prefix = key_value_prefix(key_type, value_type)
     constants["REFERENCEABLE_HEAP"] = prefix + "ReferenceableHeap"
@@ -834,14 +942,9 @@ def generate_binary_search_tree_test_utils(key_type, value_type, constants, func
 
 register_template(
     "BinarySearchTreeTestUtils",
-    [("Int", "Int"), ("Obj", "Obj"), ("Double", "Obj")],
+    KEY_VALUE_TYPES_BINARY_SEARCH_TREE,
     generate_binary_search_tree_test_utils,
-    lambda key_type, value_type: os.path.join(
-        TEST_PACKAGE_DIR,
-        "internal",
-        "ds",
-        key_value_prefix(key_type, value_type) + "BinarySearchTreeTestUtils.java",
-    ),
+    ds_source_filename(TEST_PACKAGE_DIR, "BinarySearchTreeTestUtils"),
 )
 
 
@@ -879,14 +982,9 @@ def generate_red_black_tree(key_type, value_type, constants, functions):
 
 register_template(
     "RedBlackTree",
-    [("Int", "Int"), ("Obj", "Obj"), ("Double", "Obj")],
+    KEY_VALUE_TYPES_BINARY_SEARCH_TREE,
     generate_red_black_tree,
-    lambda key_type, value_type: os.path.join(
-        PACKAGE_DIR,
-        "internal",
-        "ds",
-        key_value_prefix(key_type, value_type) + "RedBlackTree.java",
-    ),
+    ds_source_filename(PACKAGE_DIR, "RedBlackTree"),
 )
 
 
@@ -901,26 +999,14 @@ def generate_red_black_tree_test(key_type, value_type, constants, functions):
     constants["PAIRING_HEAP"] = prefix + "PairingHeap"
     if key_type == "Obj":
         constants["KEY_TYPE_GENERIC"] = "<String>"
-    if key_type == "Obj" and value_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String, String>"
-    elif key_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String>"
-    elif value_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String>"
-    else:
-        constants["KEY_VALUE_GENERIC"] = ""
+    set_test_key_value_generic(key_type, value_type, constants)
 
 
 register_template(
     "RedBlackTreeTest",
-    [("Int", "Int"), ("Obj", "Obj"), ("Double", "Obj")],
+    KEY_VALUE_TYPES_BINARY_SEARCH_TREE,
     generate_red_black_tree_test,
-    lambda key_type, value_type: os.path.join(
-        TEST_PACKAGE_DIR,
-        "internal",
-        "ds",
-        key_value_prefix(key_type, value_type) + "RedBlackTreeTest.java",
-    ),
+    ds_source_filename(TEST_PACKAGE_DIR, "RedBlackTreeTest"),
 )
 
 
@@ -939,14 +1025,9 @@ def generate_splay_tree(key_type, value_type, constants, functions):
 
 register_template(
     "SplayTree",
-    [("Int", "Int"), ("Obj", "Obj")],
+    KEY_VALUE_TYPES_BASIC,
     generate_splay_tree,
-    lambda key_type, value_type: os.path.join(
-        PACKAGE_DIR,
-        "internal",
-        "ds",
-        key_value_prefix(key_type, value_type) + "SplayTree.java",
-    ),
+    ds_source_filename(PACKAGE_DIR, "SplayTree"),
 )
 
 
@@ -960,105 +1041,367 @@ def generate_splay_tree_test(key_type, value_type, constants, functions):
     constants["PAIRING_HEAP"] = prefix + "PairingHeap"
     if key_type == "Obj":
         constants["KEY_TYPE_GENERIC"] = "<String>"
-    if key_type == "Obj" and value_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String, String>"
-    elif key_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String>"
-    elif value_type == "Obj":
-        constants["KEY_VALUE_GENERIC"] = "<String>"
-    else:
-        constants["KEY_VALUE_GENERIC"] = ""
+    set_test_key_value_generic(key_type, value_type, constants)
 
 
 register_template(
     "SplayTreeTest",
-    [("Int", "Int"), ("Obj", "Obj")],
+    KEY_VALUE_TYPES_BASIC,
     generate_splay_tree_test,
-    lambda key_type, value_type: os.path.join(
-        TEST_PACKAGE_DIR,
-        "internal",
-        "ds",
-        key_value_prefix(key_type, value_type) + "SplayTreeTest.java",
-    ),
+    ds_source_filename(TEST_PACKAGE_DIR, "SplayTreeTest"),
 )
 
 
 def clean():
     logging.info("Cleaning generated sources...")
-    if os.path.exists(HASHES_FILENAME):
+    try:
         os.remove(HASHES_FILENAME)
+    except FileNotFoundError:
+        pass
     shutil.rmtree(GENERATED_SOURCES_DIR, ignore_errors=True)
 
 
+@functools.lru_cache(maxsize=None)
 def compute_template_hash(template_filename):
-    import hashlib
-
     with open(template_filename, "rb") as template_file:
+        if sys.version_info >= (3, 11):
+            return hashlib.file_digest(template_file, HASH_ALGORITHM).digest()
         template_content = template_file.read()
-    h = hashlib.md5(template_content)
-    return hashlib.md5(template_content).hexdigest()
-
-
-def read_last_generated_templates_hashes():
-    hashes = {}
-    if os.path.exists(HASHES_FILENAME):
-        with open(HASHES_FILENAME) as hashes_file:
-            hashes = json.load(hashes_file)
-
-    def is_template_changed(template_filename):
-        template_filename = os.path.join(TEMPLATE_DIR, template_filename)
-        template_hash = compute_template_hash(template_filename)
-        return (
-            template_filename not in hashes
-            or hashes[template_filename] != template_hash
+    return hashlib.new(HASH_ALGORITHM, template_content).digest()
+
+
+def compute_generator_hash(constants, functions, script_hash, formatter_config_hash):
+    # The generated content depends on the generation code and the config functions of this script, which are covered
+    # by the hash of the whole script, and on the constants and functions of the types. The formatted content depends
+    # also on the formatter config. Functions are either format methods of strings or lambdas. Hash the format string
+    # of the first, and the output on placeholder arguments of the latter
+    functions = {
+        name: (
+            func.__self__
+            if not hasattr(func, "__code__")
+            else func(*("$" + str(i) for i in range(func.__code__.co_argcount)))
         )
+        for name, func in functions.items()
+    }
+    h = hashlib.new(HASH_ALGORITHM)
+    h.update(script_hash)
+    h.update(formatter_config_hash)
+    h.update(repr(sorted(constants.items())).encode())
+    h.update(repr(sorted(functions.items())).encode())
+    return h.digest()
+
+
+def get_file_stat(filename):
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def compute_file_hash(filename, last_file_hashes):
+    # Compare the size and modification time first, and hash the file only if they changed
+    stat = get_file_stat(filename)
+    last_hash = last_file_hashes.get(filename)
+    if last_hash is not None and last_hash[0] == stat:
+        return last_hash
+    return stat, compute_template_hash(filename)
+
+
+def read_last_generated_hashes():
+    file_hashes, output_hashes = {}, {}
+    try:
+        with open(HASHES_FILENAME, "rb") as hashes_file:
+            data = hashes_file.read()
+    except FileNotFoundError:
+        return file_hashes, output_hashes
+
+    if not data.startswith(HASHES_HEADER):
+        logging.info("Hashes file format changed, regenerating all sources.")
+        return file_hashes, output_hashes
+    pos = len(HASHES_HEADER)
+
+    def read_struct(s):
+        nonlocal pos
+        values = s.unpack_from(data, pos)
+        pos += s.size
+        return values
+
+    def read_bytes(size):
+        nonlocal pos
+        if pos + size > len(data):
+            raise struct.error("unexpected end of data")
+        pos += size
+        return data[pos - size : pos]
+
+    def read_path():
+        (path_len,) = read_struct(HASHES_PATH_LEN_STRUCT)
+        return os.path.normpath(os.path.join(TOP_DIR, read_bytes(path_len).decode()))
+
+    try:
+        (count,) = read_struct(HASHES_COUNT_STRUCT)
+        for _ in range(count):
+            filename = read_path()
+            stat = read_struct(HASHES_FILE_STAT_STRUCT)
+            file_hashes[filename] = (stat, read_bytes(HASH_SIZE))
+        (count,) = read_struct(HASHES_COUNT_STRUCT)
+        for _ in range(count):
+            filename = read_path()
+            digests = [read_bytes(HASH_SIZE) for _ in range(3)]
+            stat = read_struct(HASHES_FILE_STAT_STRUCT)
+            output_hashes[filename] = OutputHash(*digests, stat)
+    except (struct.error, UnicodeDecodeError):
+        logging.warning("Invalid hashes file, regenerating all sources.")
+        return {}, {}
+    return file_hashes, output_hashes
+
+
+def write_generated_hashes(file_hashes, output_hashes):
+    # Paths are stored relative to the top directory, so the hashes file remains valid if the project is moved
+    def pack_path(path):
+        path = os.path.relpath(path, TOP_DIR).replace(os.sep, "/").encode()
+        return [HASHES_PATH_LEN_STRUCT.pack(len(path)), path]
+
+    data = [HASHES_HEADER, HASHES_COUNT_STRUCT.pack(len(file_hashes))]
+    # Entries are sorted, so the same hashes are always serialized to the same bytes
+    for filename, (stat, file_hash) in sorted(file_hashes.items()):
+        data += pack_path(filename)
+        data += [HASHES_FILE_STAT_STRUCT.pack(*stat), file_hash]
+    data.append(HASHES_COUNT_STRUCT.pack(len(output_hashes)))
+    for filename, output_hash in sorted(output_hashes.items()):
+        data += pack_path(filename)
+        data += [output_hash.template_hash, output_hash.generator_hash]
+        data += [
+            output_hash.content_hash,
+            HASHES_FILE_STAT_STRUCT.pack(*output_hash.stat),
+        ]
+    data = b"".join(data)
 
-    class Object:
+    try:
+        with open(HASHES_FILENAME, "rb") as hashes_file:
+            if hashes_file.read() == data:
+                return
+    except FileNotFoundError:
         pass
 
-    ret = Object()
-    ret.is_template_changed = is_template_changed
-    return ret
+    # Write to a temporary file and replace, so an interrupted write doesn't leave a partial hashes file
+    os.makedirs(os.path.dirname(os.path.realpath(HASHES_FILENAME)), exist_ok=True)
+    tmp_filename = HASHES_FILENAME + ".tmp"
+    with open(tmp_filename, "wb") as hashes_file:
+        hashes_file.write(data)
+    os.replace(tmp_filename, HASHES_FILENAME)
+
 
+def get_cache_filename(output_filename, template_hash, generator_hash):
+    h = hashlib.new(HASH_ALGORITHM)
+    h.update(os.path.relpath(output_filename, TOP_DIR).replace(os.sep, "/").encode())
+    h.update(template_hash)
+    h.update(generator_hash)
+    return os.path.join(GENERATED_CACHE_DIR, h.hexdigest() + ".java")
+
+
+def restore_cached_output(cache_filename, output_filename):
+    try:
+        with open(cache_filename, "rb") as cache_file:
+            data = cache_file.read()
+    except FileNotFoundError:
+        return False
+    # Touch the entry, the entries are evicted by their modification time
+    os.utime(cache_filename)
 
-def write_generated_templates():
-    templates = [
-        os.path.join(TEMPLATE_DIR, generator["template"]) for generator in TEMPLATES
+    try:
+        with open(output_filename, "rb") as output_file:
+            if output_file.read() == data:
+                return True
+    except FileNotFoundError:
+        pass
+    logging.info("Restoring %s from cache", os.path.relpath(output_filename, TOP_DIR))
+    os.makedirs(os.path.dirname(os.path.realpath(output_filename)), exist_ok=True)
+    tmp_filename = output_filename + ".tmp"
+    with open(tmp_filename, "wb") as output_file:
+        output_file.write(data)
+    os.replace(tmp_filename, output_filename)
+    return True
+
+
+def store_cached_outputs(cache_filenames):
+    os.makedirs(GENERATED_CACHE_DIR, exist_ok=True)
+    for output_filename, cache_filename in cache_filenames.items():
+        tmp_filename = cache_filename + ".tmp"
+        shutil.copyfile(output_filename, tmp_filename)
+        os.replace(tmp_filename, cache_filename)
+
+    cache_entries = [
+        os.path.join(GENERATED_CACHE_DIR, filename)
+        for filename in os.listdir(GENERATED_CACHE_DIR)
+        if filename.endswith(".java")
     ]
-    hashes = json.dumps({temp: compute_template_hash(temp) for temp in templates})
+    if len(cache_entries) > GENERATED_CACHE_MAX_FILES:
+        cache_entries.sort(key=os.path.getmtime)
+        for filename in cache_entries[: len(cache_entries) - GENERATED_CACHE_MAX_FILES]:
+            os.remove(filename)
 
-    os.makedirs(os.path.dirname(os.path.realpath(HASHES_FILENAME)), exist_ok=True)
-    with open(HASHES_FILENAME, "w") as hashes_file:
-        hashes_file.write(hashes)
+
+def init_logging():
+    logging.basicConfig(format="[%(levelname)s] %(message)s", level=logging.INFO)
+
+
+def init_worker(template_filenames):
+    # The templates are parsed once per worker before it takes jobs. Forked workers inherit the templates parsed by
+    # the main process, spawned workers parse them here
+    init_logging()
+    for template_filename in template_filenames:
+        parse_template(template_filename)
 
 
 def main():
-    logging.basicConfig(format="[%(levelname)s] %(message)s", level=logging.INFO)
+    init_logging()
 
     parser = argparse.ArgumentParser(description="Auto source generator")
     parser.add_argument("--clean", action="store_true")
+    # Formatting is the slowest part of the generation, it can be skipped for local development. Like when eclipse is
+    # not found, the files are left unformatted until they are generated again
+    parser.add_argument("--no-format", action="store_true")
     args = parser.parse_args()
 
     if args.clean:
         clean()
 
     else:
-        hashes = read_last_generated_templates_hashes()
-        generated_files = []
+        last_file_hashes, last_output_hashes = read_last_generated_hashes()
+        script_filename = os.path.realpath(__file__)
+        input_filenames = [script_filename, ECLIPSE_FORMATTER_CONFIG_FILE] + [
+            os.path.join(TEMPLATE_DIR, generator["template"]) for generator in TEMPLATES
+        ]
+        file_hashes = {
+            filename: compute_file_hash(filename, last_file_hashes)
+            for filename in input_filenames
+        }
 
-        is_template_changed = False
-        for generator in TEMPLATES:
-            if hashes.is_template_changed(generator["template"]):
-                is_template_changed = True
-                generated_files += generate_template_sources(generator)
+        # If neither the templates nor this script changed, the generated files are up to date if they were not
+        # modified or deleted since the last run
+        if (
+            last_output_hashes
+            and all(file_hashes[f] == last_file_hashes.get(f) for f in input_filenames)
+            and all(get_file_stat(f) == h.stat for f, h in last_output_hashes.items())
+        ):
+            logging.info("Generated sources are up to date, nothing to do.")
+            return
 
-        if not is_template_changed:
-            logging.info("No template changed, nothing to do.")
+        # Each generated file depends only on its template and the generator configuration of its types, so it is
+        # regenerated only if one of them changed
+        output_hashes = {}
+        jobs = []
+        template_filenames = []
+        cache_filenames = {}
+        for template_idx, generator in enumerate(TEMPLATES):
+            template_filename = os.path.join(TEMPLATE_DIR, generator["template"])
+            template_hash = file_hashes[template_filename][1]
+            template_jobs = []
+            function_names = set()
+            for types in generator["types"]:
+                constants, functions, filename = get_template_source_config(
+                    generator, types
+                )
+                function_names.update(functions)
+                generator_hash = compute_generator_hash(
+                    constants,
+                    functions,
+                    file_hashes[script_filename][1],
+                    file_hashes[ECLIPSE_FORMATTER_CONFIG_FILE][1],
+                )
+                last_hash = last_output_hashes.get(filename)
+                # An output modified since the last run is regenerated and rewritten
+                output_modified = (
+                    last_hash is None or get_file_stat(filename) != last_hash.stat
+                )
+                if (
+                    not output_modified
+                    and last_hash.template_hash == template_hash
+                    and last_hash.generator_hash == generator_hash
+                ):
+                    output_hashes[filename] = last_hash
+                    continue
+
+                cache_filename = get_cache_filename(
+                    filename, template_hash, generator_hash
+                )
+                if restore_cached_output(cache_filename, filename):
+                    # The content generated before formatting is unknown, the output is compared with the generated
+                    # content if it is regenerated
+                    output_hashes[filename] = OutputHash(
+                        template_hash,
+                        generator_hash,
+                        bytes(HASH_SIZE),
+                        get_file_stat(filename),
+                    )
+                else:
+                    # The content hash and the stat are set once the file is generated
+                    cache_filenames[filename] = cache_filename
+                    output_hashes[filename] = OutputHash(
+                        template_hash, generator_hash, None, None
+                    )
+                    last_content_hash = (
+                        last_hash.content_hash if not output_modified else None
+                    )
+                    template_jobs.append((template_idx, types, last_content_hash))
+            if template_jobs:
+                validate_template(template_filename, frozenset(function_names))
+                parse_template(template_filename)
+                template_filenames.append(template_filename)
+                jobs += template_jobs
+
+        if not jobs:
+            logging.info("Generated sources are up to date, nothing to do.")
+            write_generated_hashes(file_hashes, output_hashes)
             return
 
-        format_source_files(generated_files)
+        # Don't start more worker processes than there are jobs, a small change usually regenerates only a few files
+        max_workers = min(len(jobs), os.cpu_count() or 1)
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=init_worker,
+            initargs=(template_filenames,),
+        ) as executor:
+            futures = [
+                executor.submit(generate_template_source_job, job) for job in jobs
+            ]
+
+            def generated_files():
+                for future in concurrent.futures.as_completed(futures):
+                    filename, needs_format, content_hash = future.result()
+                    output_hashes[filename] = output_hashes[filename]._replace(
+                        content_hash=content_hash
+                    )
+                    if needs_format:
+                        generated_filenames.append(filename)
+                        yield filename
+
+            generated_filenames = []
+            if args.no_format:
+                for _ in generated_files():
+                    pass
+                formatted = False
+            else:
+                formatted = format_source_files(generated_files())
+
+        # Only formatted outputs are cached, the cache is used as a replacement for both generation and formatting
+        if formatted:
+            store_cached_outputs(
+                {
+                    filename: cache_filenames[filename]
+                    for filename in generated_filenames
+                }
+            )
+
+        # The stat of the outputs is taken after formatting, which modifies them
+        for filename, output_hash in output_hashes.items():
+            if output_hash.stat is None:
+                output_hashes[filename] = output_hash._replace(
+                    stat=get_file_stat(filename)
+                )
 
-        write_generated_templates()
+        write_generated_hashes(file_hashes, output_hashes)
 
 
 if __name__ == "__main__":
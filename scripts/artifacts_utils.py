@@ -1,30 +1,49 @@
-# breaking grequests breaks requests (https://github.com/spyoungtech/grequests/issues/103), workaround:
-from gevent import monkey
-
-
-def stub(*args, **kwargs): # pylint: disable=unused-argument
-	pass
-monkey.patch_all = stub
+import asyncio
+import concurrent.futures
+import io
 import json
 import os
-import shutil
 import tarfile
 import zipfile
 
-import grequests
+import httpx
 import requests
 
 
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "jgalgo-bench")
+
+
 def get_artifacts_description_all():
 	url = 'https://api.github.com/repos/barakugav/JGAlgo/actions/artifacts'
 	headers = {
 		'Accept': 'application/vnd.github+json',
 		'X-GitHub-Api-Version': '2022-11-28'
 	}
+	# authenticated requests have a higher rate limit
+	token = os.environ.get('GITHUB_TOKEN')
+	if token:
+		headers['Authorization'] = f'Bearer {token}'
+	# the listing is cached with its ETag, if it didn't change the API responds with 304 (Not Modified)
+	cache_path = os.path.join(CACHE_DIR, "artifacts.json")
+	cached = None
+	try:
+		with open(cache_path) as cache_file:
+			cached = json.load(cache_file)
+		headers['If-None-Match'] = cached['etag']
+	except (FileNotFoundError, ValueError, KeyError):
+		cached = None
 	resp = requests.get(url, headers=headers)
-	if not resp.ok:
-		raise ValueError(resp)
-	artifacts = json.loads(resp.content)['artifacts']
+	if resp.status_code == 304 and cached is not None:
+		artifacts = cached['artifacts']
+	else:
+		if not resp.ok:
+			raise ValueError(resp)
+		artifacts = json.loads(resp.content)['artifacts']
+		etag = resp.headers.get('ETag')
+		if etag is not None:
+			os.makedirs(CACHE_DIR, exist_ok=True)
+			with open(cache_path, 'w') as cache_file:
+				json.dump({'etag': etag, 'artifacts': artifacts}, cache_file)
 	artifacts = {a['id']:a for a in artifacts}
 	return artifacts
 
@@ -35,6 +54,27 @@ def get_artifacts_description(name):
 			artifacts[id] = artifact
 	return artifacts
 
+def extract_artifact(id, content, outdir):
+	# the tar is streamed out of the in-memory zip, without writing the zip or the tar to disk
+	dir_path = os.path.join(outdir, str(id))
+	with zipfile.ZipFile(io.BytesIO(content), 'r') as zip_ref:
+		with zip_ref.open("bench_results.tar.gz") as tar_file:
+			with tarfile.open(fileobj=tar_file, mode="r|gz") as tar:
+				tar.extractall(dir_path)
+
+async def fetch_all(urls):
+	# nightly.link redirects each download to the artifact storage, so the downloads don't share a single HTTP/2
+	# connection. At most 16 connections are opened and the other downloads wait for a free one without a time limit.
+	# nightly.link resolves each artifact through the GitHub API and may respond slower than the default 5s timeout
+	limits = httpx.Limits(max_connections=16)
+	timeout = httpx.Timeout(60.0, pool=None)
+	async with httpx.AsyncClient(http2=True, follow_redirects=True, limits=limits, timeout=timeout) as client:
+		async def fetch(url):
+			resp = await client.get(url)
+			resp.raise_for_status()
+			return resp.content
+		return await asyncio.gather(*[fetch(url) for url in urls])
+
 def download_artifacts(artifacts, outdir):
 	urls = []
 	for id, artifact in artifacts.items():
@@ -47,26 +87,13 @@ def download_artifacts(artifacts, outdir):
 	print("downloading artifacts...")
 	for url in urls:
 		print(f"\t{url}")
-	rs = (grequests.get(u) for u in urls)
-	rs = grequests.map(rs)
-
-	for (id, artifact), resp in zip(artifacts.items(), rs):
-
-		zip_path = os.path.join(outdir, str(id) + ".zip")
-		with open(zip_path, 'wb') as fd:
-			chunk_size = 128
-			for chunk in resp.iter_content(chunk_size=chunk_size):
-				fd.write(chunk)
-
-		dir_path_temp = os.path.join(outdir, str(id) + "temp")
-		with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-			zip_ref.extractall(dir_path_temp)
-		os.remove(zip_path)
-		tar_path = os.path.join(dir_path_temp, "bench_results.tar.gz")
+	contents = asyncio.run(fetch_all(urls))
 
-		dir_path = os.path.join(outdir, str(id))
-		with tarfile.open(tar_path, "r:gz") as tar:
-			tar.extractall(dir_path)
-		shutil.rmtree(dir_path_temp)
+	# decompression is CPU bound, extract the artifacts in parallel
+	max_workers = max(1, min(len(artifacts), os.cpu_count() or 1))
+	with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+		futures = [executor.submit(extract_artifact, id, content, outdir) for id, content in zip(artifacts.keys(), contents)]
+		for future in futures:
+			future.result()
 
 	print("all artifacts downloaded successfully")
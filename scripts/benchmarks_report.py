@@ -12,70 +12,96 @@ import numpy as np
 import requests
 from matplotlib import pyplot as plt
 
+# the plots are only rendered to an image file, the Agg backend doesn't need a display
+matplotlib.use('Agg')
+
+# Agg can't render images larger than 2^16 pixels in each dimension, so the benchmarks are drawn in figures of at most
+# FIGURE_MAX_ROWS rows of subplots, and the rendered figures are stacked into the result image
+FIGURE_COLS = 2
+FIGURE_MAX_ROWS = 32
+FIGURE_DPI = 100
+SUBPLOT_SIZE = (6.4, 4.8)
+assert FIGURE_MAX_ROWS * SUBPLOT_SIZE[1] * FIGURE_DPI < 2**16
+assert FIGURE_COLS * SUBPLOT_SIZE[0] * FIGURE_DPI < 2**16
+
 
 def read_results_file(path):
-	results = []
-	with open(path) as csvfile:
-		spamreader = csv.reader(csvfile)
-		first_row = True
-		columns = None
-		for row in spamreader:
-			if first_row:
-				columns = row
-				first_row = False
-			else:
-				res = {}
-				for c in range(len(columns)):
-					res[columns[c]] = row[c]
-				results.append(res)
-	return results
+	with open(path, newline='') as csvfile:
+		return list(csv.DictReader(csvfile))
+
+
+def draw_benchmarks(benchmarks, artifacts):
+	rows = (len(benchmarks) + FIGURE_COLS - 1) // FIGURE_COLS
+	figsize = (SUBPLOT_SIZE[0] * FIGURE_COLS, SUBPLOT_SIZE[1] * rows)
+	fig, axes = plt.subplots(rows, FIGURE_COLS, figsize=figsize, dpi=FIGURE_DPI, squeeze=False)
+	axes = axes.flatten()
+	for ax, (bench_key, results) in zip(axes, benchmarks):
+		print("analyzing benchmark", bench_key[0], bench_key[1])
+		results = sorted(results, key=lambda r: artifacts[r['id']]['created_at'])
+		scores = [float(res['Score']) for res in results]
+		created_at = [artifacts[res['id']]['date'] for res in results]
+
+		ax.set_title(f"{bench_key[0]} {bench_key[1]}", fontsize='small')
+		ax.plot(created_at, scores, 'b-')
+		ax.tick_params(axis='x', labelrotation=90)
+	for ax in axes[len(benchmarks):]:
+		ax.set_visible(False)
+	fig.tight_layout()
+	fig.canvas.draw()
+	img = np.array(fig.canvas.buffer_rgba())
+	plt.close(fig)
+	return img
 
 
 def create_report(out_img):
 	artifacts = artifacts_utils.get_artifacts_description("jmh-benchmarks-results")
-	with tempfile.TemporaryDirectory() as artifacts_dir:
-		artifacts_utils.download_artifacts(artifacts, artifacts_dir)
-		for id, artifact in artifacts.items():
-			res_path = os.path.join(artifacts_dir, str(id), "bench_results", "bench_results.csv")
-			artifact['benchmarks'] = read_results_file(res_path)
-		benchmarks = dict()
-		for id, artifact in artifacts.items():
-			for bench in artifact['benchmarks']:
-				bench_name = bench['Benchmark']
-				bench_params = bench['Param: args']
-				bench_key = (bench_name, bench_params)
-				if bench_key not in benchmarks:
-					benchmarks[bench_key] = list()
-				bench['id'] = id
-				benchmarks[bench_key].append(bench)
-
-		imgs = []
-		temp_img_file = "temp.png"
+
+	# artifacts are immutable, the results of each artifact are cached by its id and only new artifacts are downloaded
+	missing_artifacts = {}
+	for id, artifact in artifacts.items():
+		cache_path = os.path.join(artifacts_utils.CACHE_DIR, str(id) + ".json")
 		try:
-			for bench_key, results in benchmarks.items():
-				print("analyzing benchmark", bench_key[0], bench_key[1])
-				results = sorted(results, key=lambda r: artifacts[r['id']]['created_at'])
-				scores = [float(res['Score']) for res in results]
-				created_at = []
-				for res in results:
-					artifact = artifacts[res['id']]
-					date = datetime.strptime(artifact['created_at'][0:10], '%Y-%m-%d')
-					created_at.append(date)
-
-				plt.gcf().suptitle(f"{bench_key[0]} {bench_key[1]}")
-				plt.plot_date(matplotlib.dates.date2num(created_at), scores,'b-')
-				plt.xticks(rotation=90)
-				plt.savefig(temp_img_file)
-				plt.clf()
-				with open(temp_img_file, 'rb') as image_file:
-					image = plt.imread(image_file)
-				imgs.append(np.array(image))
-		finally:
-			if os.path.exists(temp_img_file):
-				os.remove(temp_img_file)
-		imgs = np.concatenate(imgs)
-		print(f"Saving result image to {out_img}")
-		matplotlib.pyplot.imsave(out_img, imgs)
+			with open(cache_path) as cache_file:
+				artifact['benchmarks'] = json.load(cache_file)
+		except (FileNotFoundError, ValueError):
+			missing_artifacts[id] = artifact
+	if missing_artifacts:
+		with tempfile.TemporaryDirectory() as artifacts_dir:
+			artifacts_utils.download_artifacts(missing_artifacts, artifacts_dir)
+			os.makedirs(artifacts_utils.CACHE_DIR, exist_ok=True)
+			for id, artifact in missing_artifacts.items():
+				res_path = os.path.join(artifacts_dir, str(id), "bench_results", "bench_results.csv")
+				artifact['benchmarks'] = read_results_file(res_path)
+				# written to a temporary file and replaced, so an interrupted run doesn't leave a truncated cache entry
+				cache_path = os.path.join(artifacts_utils.CACHE_DIR, str(id) + ".json")
+				tmp_path = cache_path + ".tmp"
+				with open(tmp_path, 'w') as cache_file:
+					json.dump(artifact['benchmarks'], cache_file)
+				os.replace(tmp_path, cache_path)
+
+	benchmarks = dict()
+	for id, artifact in artifacts.items():
+		for bench in artifact['benchmarks']:
+			bench_name = bench['Benchmark']
+			bench_params = bench['Param: args']
+			bench_key = (bench_name, bench_params)
+			if bench_key not in benchmarks:
+				benchmarks[bench_key] = list()
+			bench['id'] = id
+			benchmarks[bench_key].append(bench)
+
+	for artifact in artifacts.values():
+		artifact['date'] = datetime.strptime(artifact['created_at'][0:10], '%Y-%m-%d')
+
+	benchmarks = list(benchmarks.items())
+	benchmarks_per_figure = FIGURE_COLS * FIGURE_MAX_ROWS
+	imgs = [
+		draw_benchmarks(benchmarks[i:i + benchmarks_per_figure], artifacts)
+		for i in range(0, len(benchmarks), benchmarks_per_figure)
+	]
+	imgs = np.concatenate(imgs)
+	print(f"Saving result image to {out_img}")
+	plt.imsave(out_img, imgs)
 
 
 def main():
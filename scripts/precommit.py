@@ -1,45 +1,131 @@
 import argparse
+import functools
+import hashlib
 import os
+import pathlib
+import shutil
 import subprocess
 
 SCRIPTS_DIR = os.path.dirname(os.path.realpath(__file__))
 TOP_DIR = os.path.abspath(os.path.join(SCRIPTS_DIR, ".."))
+PRECOMMIT_CACHE_DIR = os.path.join(TOP_DIR, ".precommit-cache")
+
+# Glob patterns, relative to TOP_DIR, of the files each stage depends on. This script
+# is included, as it defines the commands of the stages
+BUILD_INPUTS = (
+    "pom.xml",
+    "*/pom.xml",
+    "*/spotbugs-exclude.xml",
+    "ect/*",
+    "jgalgo-core/gensources.py",
+    "jgalgo-core/template/*",
+    "scripts/precommit.py",
+)
+ALL_INPUTS = BUILD_INPUTS + ("*/src/**/*",)
+MAIN_INPUTS = BUILD_INPUTS + ("*/src/main/**/*",)
+# The poms pin the versions of the dependencies and plugins
+POM_INPUTS = ("pom.xml", "*/pom.xml")
+
+
+def find_maven():
+    # The Maven daemon keeps a warm JVM between the stages, use it if it is installed.
+    # The full path is used as there is no shell to resolve it, on Windows it is the
+    # path of the 'mvn.cmd' script
+    for name in ["mvnd", "mvn"]:
+        path = shutil.which(name)
+        if path is not None:
+            return path
+    return "mvn"
+
+
+# The stages share most of their inputs, each file is read and hashed once per run
+@functools.lru_cache(maxsize=None)
+def compute_file_hash(filename):
+    return hashlib.sha256(filename.read_bytes()).digest()
+
+
+@functools.lru_cache(maxsize=None)
+def compute_inputs_hash(patterns):
+    h = hashlib.sha256()
+    top_dir = pathlib.Path(TOP_DIR)
+    filenames = {
+        f for pattern in patterns for f in top_dir.glob(pattern) if f.is_file()
+    }
+    for filename in sorted(filenames):
+        h.update(filename.relative_to(top_dir).as_posix().encode())
+        h.update(compute_file_hash(filename))
+    return h.hexdigest()
 
 
 def main(args):
+    mvn = find_maven()
+
     def run_cmd(cmd):
-        subprocess.check_call(cmd, cwd=TOP_DIR, shell=True)
-
-    print("\n\n ============ Clean and Build ============\n")
-    if not args.skip_rebuild:
-        run_cmd("mvn clean")
-        run_cmd("mvn package -Dmaven.test.skip")
-    else:
-        print("skipping...")
-
-    print("\n\n ============ Tests ============\n")
-    if not args.skip_tests:
-        run_cmd("mvn test jacoco:report")
-    else:
-        print("skipping...")
-
-    print("\n\n ============ SpotBugs ============\n")
-    if not args.skip_static:
-        run_cmd("mvn compile spotbugs:check -pl -jgalgo-bench")
-    else:
-        print("skipping...")
-
-    print("\n\n ============ Checkstyle ============\n")
-    if not args.skip_style:
-        run_cmd("mvn compile checkstyle:check")
-    else:
-        print("skipping...")
-
-    print("\n\n ============ Javadoc ============\n")
-    if not args.skip_javadoc:
-        run_cmd("mvn javadoc:aggregate")
-    else:
-        print("skipping...")
+        subprocess.check_call(cmd, cwd=TOP_DIR)
+
+    # A stage is skipped if the hash of its inputs is the same as in its last successful
+    # run. The build resolves the dependencies, and a later stage that succeeded before
+    # with the same poms already has its plugins in the local repository, so it is run
+    # offline without checking the remote ones. The build doesn't resolve the plugins of
+    # the later stages, so after a version bump in the poms they run online.
+    def run_stage(name, title, skip, inputs, cmds, offline=True):
+        print(f"\n\n ============ {title} ============\n")
+        if skip:
+            print("skipping...")
+            return
+        cache_filename = os.path.join(PRECOMMIT_CACHE_DIR, name)
+        inputs_hash = compute_inputs_hash(inputs)
+        pom_hash = compute_inputs_hash(POM_INPUTS)
+        try:
+            with open(cache_filename) as cache_file:
+                last_hashes = cache_file.read().split()
+        except FileNotFoundError:
+            last_hashes = []
+        if not args.force and last_hashes[:1] == [inputs_hash]:
+            print("skipping (unchanged)...")
+            return
+        if offline and last_hashes[1:2] == [pom_hash]:
+            cmds = [[cmd[0], "-o"] + cmd[1:] for cmd in cmds]
+        for cmd in cmds:
+            run_cmd(cmd)
+        os.makedirs(PRECOMMIT_CACHE_DIR, exist_ok=True)
+        with open(cache_filename, "w") as cache_file:
+            cache_file.write(inputs_hash + "\n" + pom_hash + "\n")
+
+    # Maven builds incrementally, the project is cleaned only if the run is forced
+    build_cmds = [[mvn, "clean"]] if args.force else []
+    build_cmds.append([mvn, "package", "-T", "1C", "-Dmaven.test.skip"])
+    run_stage(
+        "build", "Build", args.skip_rebuild, ALL_INPUTS, build_cmds, offline=False
+    )
+    run_stage(
+        "tests",
+        "Tests",
+        args.skip_tests,
+        ALL_INPUTS,
+        [[mvn, "test", "jacoco:report"]],
+    )
+    run_stage(
+        "static",
+        "SpotBugs",
+        args.skip_static,
+        MAIN_INPUTS,
+        [[mvn, "compile", "spotbugs:check", "-pl", "-jgalgo-bench"]],
+    )
+    run_stage(
+        "style",
+        "Checkstyle",
+        args.skip_style,
+        ALL_INPUTS,
+        [[mvn, "compile", "checkstyle:check"]],
+    )
+    run_stage(
+        "javadoc",
+        "Javadoc",
+        args.skip_javadoc,
+        MAIN_INPUTS,
+        [[mvn, "javadoc:aggregate"]],
+    )
 
     print("\nPre-commit check passed successfully")
 
@@ -59,5 +145,10 @@ if __name__ == "__main__":
     parser.add_argument(
         "--skip-javadoc", action="store_true", help="skip Javadoc generation"
     )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="clean and run all stages, even if their inputs didn't change",
+    )
     args = parser.parse_args()
     main(args)